@@ -10,6 +10,7 @@ from tqdm import tqdm
 import numpy as np
 import torch
 from torch_geometric.data import Dataset, Data, extract_zip
+from deepsphere.data.transforms.transforms import ToClassIndices
 from deepsphere.utils.get_ico_coords import get_ico_coords
 from torchvision.datasets.utils import download_url
 
@@ -34,8 +35,11 @@ class ARTCDataset(Dataset):
             download (bool): Flag to decide if data should be downloaded or not.
         """
         super(ARTCDataset, self).__init__(root, transform, None, None)
-        self.files = h5py.File(self.processed_paths[0], 'r')
-        self.N = self.files['data'].shape[0]
+        self.h5_file = self.processed_paths[0]
+        with h5py.File(self.h5_file, 'r') as hf:
+            self.N = hf['data'].shape[0]
+        # h5py handles are not fork-safe, each dataloader worker opens its own on first access
+        self.files = None
         self.idxs = indices if indices is not None else list(range(self.N))
 
     @property
@@ -87,6 +91,8 @@ class ARTCDataset(Dataset):
         return len(self.idxs)
 
     def get(self, idx):
+        if self.files is None:
+            self.files = h5py.File(self.h5_file, 'r')
         idx = self.idxs[idx]
         data, labels = self.files['data'][idx], self.files["labels"][idx]
         return Data(x=torch.FloatTensor(data),
@@ -109,18 +115,70 @@ class ARTCH5Dataset(Dataset):
             download (bool): Flag to decide if data should be downloaded or not.
         """
         super(ARTCH5Dataset, self).__init__(None, transform, None, None)
-        self.files = h5py.File(h5_file, 'r')
-        self.N = self.files['data'].shape[0]
+        self.h5_file = h5_file
+        with h5py.File(self.h5_file, 'r') as hf:
+            self.N = hf['data'].shape[0]
+        # h5py handles are not fork-safe, each dataloader worker opens its own on first access
+        self.files = None
         self.idxs = indices if indices is not None else list(range(self.N))
 
     def len(self):
         return len(self.idxs)
 
     def get(self, idx):
+        if self.files is None:
+            self.files = h5py.File(self.h5_file, 'r')
         idx = self.idxs[idx]
         data, labels = self.files['data'][idx], self.files["labels"][idx]
-        return Data(x=torch.FloatTensor(data),
-                    y=torch.FloatTensor(labels))
+        return Data(x=torch.from_numpy(data).float(),
+                    y=torch.from_numpy(labels))
+
+
+def write_normalized_h5(dataset, means, stds, h5_file):
+    """Normalize a dataset once and write it to a HDF5 file readable by ARTCH5Dataset,
+    instead of normalizing every sample at every epoch.
+    The data is stored in float16 and the labels as uint8 class indices.
+    Nothing is written if the file already holds the dataset normalized with the same means and stds.
+
+    Args:
+        dataset (:obj:`ARTCDataset`): Dataset to normalize, without transform.
+        means (:obj:`numpy.array`): means of each feature
+        stds (:obj:`numpy.array`): standard deviations of each feature
+        h5_file (str): Path of the HDF5 file.
+    """
+    if os.path.exists(h5_file):
+        with h5py.File(h5_file, 'r') as hf:
+            if np.array_equal(hf.attrs.get('means'), means) and np.array_equal(hf.attrs.get('stds'), stds) \
+                    and hf['data'].shape[0] == len(dataset) and hf['labels'].dtype == np.uint8:
+                return
+
+    N = len(dataset)
+    item = dataset[0]
+    data_shape = tuple(item.x.shape)
+    label_shape = tuple(item.y.shape[:-1])
+
+    # written under a temporary name and moved in place once complete, an interrupted run leaves no valid cache
+    tmp_file = h5_file + '.tmp'
+    with h5py.File(tmp_file, 'w') as hf:
+        hf.attrs['means'] = means
+        hf.attrs['stds'] = stds
+        dset = hf.create_dataset("data",
+                                 shape=(N,) + data_shape,
+                                 chunks=(1,) + data_shape,
+                                 dtype='f2',
+                                 compression='gzip')
+        lset = hf.create_dataset("labels",
+                                 shape=(N,) + label_shape,
+                                 chunks=(1,) + label_shape,
+                                 dtype='u1',
+                                 compression='gzip')
+
+        to_class_indices = ToClassIndices()
+        for i in tqdm(range(N)):
+            item = to_class_indices(dataset[i])
+            dset[i] = (item.x.numpy() - means) / stds
+            lset[i] = item.y.numpy()
+    os.replace(tmp_file, h5_file)
 
 
 class ARTCTemporaldataset(ARTCDataset):
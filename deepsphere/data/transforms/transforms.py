@@ -60,6 +60,22 @@ class Normalize:
         return item
 
 
+class ToClassIndices:
+    """Convert one-hot labels to class indices.
+    """
+
+    def __call__(self, item: Data):
+        """
+        Args:
+            item (:obj:`torch_geometric.data.Data`): Sample whose labels are of size (vertices, classes).
+
+        Returns:
+            :obj:`torch_geometric.data.Data`: Sample whose labels are class indices of size (vertices).
+        """
+        item.y = item.y.argmax(-1)
+        return item
+
+
 class Stack:
     """Stack images in torch tensor.
     """
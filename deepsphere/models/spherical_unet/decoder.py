@@ -19,7 +19,7 @@ class SphericalChebBNPoolCheb(nn.Module):
             in_channels (int): initial number of channels.
             middle_channels (int): middle number of channels.
             out_channels (int): output number of channels.
-            lap (:obj:`torch.sparse.FloatTensor`): laplacian.
+            lap (:obj:`SphericalLaplacian`): laplacian.
             pooling (:obj:`torch.nn.Module`): pooling/unpooling module.
             kernel_size (int, optional): polynomial degree. Defaults to 3.
         """
@@ -53,7 +53,7 @@ class SphericalChebBNPoolConcat(nn.Module):
         Args:
             in_channels (int): initial number of channels.
             out_channels (int): output number of channels.
-            lap (:obj:`torch.sparse.FloatTensor`): laplacian.
+            lap (:obj:`SphericalLaplacian`): laplacian.
             pooling (:obj:`torch.nn.Module`): pooling/unpooling module.
             kernel_size (int, optional): polynomial degree. Defaults to 3.
         """
@@ -83,38 +83,23 @@ class Decoder(nn.Module):
     """The decoder of the Spherical UNet.
     """
 
-    def __init__(self, unpooling, kernel_size, edge_index_list: list, edge_weight_list: list,
-                 laplacian_type):
+    def __init__(self, unpooling, laps, kernel_size):
         """Initialization.
 
         Args:
             unpooling (:obj:`torch.nn.Module`): The unpooling object.
-            laps (list): List of laplacians.
+            laps (list): List of laplacians, one per level.
+            kernel_size (int): polynomial degree.
         """
         super().__init__()
         self.unpooling = unpooling
         self.kernel_size = kernel_size
-        assert len(edge_index_list) == len(edge_weight_list) == 5
-        self.dec_l1 = SphericalChebBNPoolConcat(512, 512, self.unpooling, self.kernel_size,
-                                                edge_index=edge_index_list[0],
-                                                edge_weight=edge_weight_list[0],
-                                                laplacian_type=laplacian_type)
-        self.dec_l2 = SphericalChebBNPoolConcat(512, 256, self.unpooling, self.kernel_size,
-                                                edge_index=edge_index_list[1],
-                                                edge_weight=edge_weight_list[1],
-                                                laplacian_type=laplacian_type)
-        self.dec_l3 = SphericalChebBNPoolConcat(256, 128, self.unpooling, self.kernel_size,
-                                                edge_index=edge_index_list[2],
-                                                edge_weight=edge_weight_list[2],
-                                                laplacian_type=laplacian_type)
-        self.dec_l4 = SphericalChebBNPoolConcat(128, 64, self.unpooling, self.kernel_size,
-                                                edge_index=edge_index_list[3],
-                                                edge_weight=edge_weight_list[3],
-                                                laplacian_type=laplacian_type)
-        self.dec_l5 = SphericalChebBNPoolCheb(64, 32, 3, self.unpooling, self.kernel_size,
-                                              edge_index=edge_index_list[4],
-                                              edge_weight=edge_weight_list[4],
-                                              laplacian_type=laplacian_type)
+        assert len(laps) == 5
+        self.dec_l1 = SphericalChebBNPoolConcat(512, 512, self.unpooling, self.kernel_size, lap=laps[0])
+        self.dec_l2 = SphericalChebBNPoolConcat(512, 256, self.unpooling, self.kernel_size, lap=laps[1])
+        self.dec_l3 = SphericalChebBNPoolConcat(256, 128, self.unpooling, self.kernel_size, lap=laps[2])
+        self.dec_l4 = SphericalChebBNPoolConcat(128, 64, self.unpooling, self.kernel_size, lap=laps[3])
+        self.dec_l5 = SphericalChebBNPoolCheb(64, 32, 3, self.unpooling, self.kernel_size, lap=laps[4])
 
     def forward(self, x_enc0, x_enc1, x_enc2, x_enc3, x_enc4):
         """Forward Pass.
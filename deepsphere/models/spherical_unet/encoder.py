@@ -1,10 +1,46 @@
 """Encoder for Spherical UNet.
 """
 # pylint: disable=W0221
+import torch
 from torch import nn
+from torch.utils.checkpoint import checkpoint
+
 from deepsphere.models.spherical_unet.utils import SphericalChebBN, SphericalChebBNPool, SphericalChebConv
 
 
+def checkpoint_bn(module, x):
+    """Activation checkpointing which keeps the batchnorm running statistics of the recompute out of the model.
+
+    Args:
+        module (:obj:`torch.nn.Module`): block to checkpoint.
+        x (:obj:`torch.Tensor`): input [batch x vertices x channels/features]
+
+    Returns:
+        :obj:`torch.Tensor`: output [batch x vertices x channels/features]
+    """
+    calls = []
+
+    def running_stats(m):
+        return [buf for buf in (m.running_mean, m.running_var, m.num_batches_tracked) if buf is not None]
+
+    def run(inputs):
+        if not calls:
+            calls.append(True)
+            return module(inputs)
+        # recompute during backward: the running statistics were already updated by the first pass
+        batchnorms = [m for m in module.modules() if getattr(m, "track_running_stats", False)]
+        states = [[buf.clone() for buf in running_stats(m)] for m in batchnorms]
+        try:
+            return module(inputs)
+        finally:
+            with torch.no_grad():
+                for m, state in zip(batchnorms, states):
+                    for buf, saved in zip(running_stats(m), state):
+                        buf.copy_(saved)
+
+    return checkpoint(run, x, use_reentrant=False)
+
+
 class SphericalChebBN2(nn.Module):
     """Building Block made of 2 Building Blocks (convolution, batchnorm, activation).
     """
@@ -16,7 +52,7 @@ class SphericalChebBN2(nn.Module):
             in_channels (int): initial number of channels.
             middle_channels (int): middle number of channels.
             out_channels (int): output number of channels.
-            lap (:obj:`torch.sparse.FloatTensor`): laplacian.
+            lap (:obj:`SphericalLaplacian`): laplacian.
             kernel_size (int, optional): polynomial degree.
         """
 
@@ -50,7 +86,7 @@ class SphericalChebPool(nn.Module):
         Args:
             in_channels (int): initial number of channels.
             out_channels (int): output number of channels.
-            lap (:obj:`torch.sparse.FloatTensor`): laplacian.
+            lap (:obj:`SphericalLaplacian`): laplacian.
             pooling (:obj:`torch.nn.Module`): pooling/unpooling module.
             kernel_size (int, optional): polynomial degree.
         """
@@ -77,41 +113,24 @@ class Encoder(nn.Module):
     """Encoder for the Spherical UNet.
     """
 
-    def __init__(self, pooling, kernel_size, edge_index_list: list, edge_weight_list: list, laplacian_type):
+    def __init__(self, pooling, laps, kernel_size):
         """Initialization.
 
         Args:
             pooling (:obj:`torch.nn.Module`): pooling layer.
+            laps (list): List of laplacians, one per level.
             kernel_size (int): polynomial degree.
         """
         super().__init__()
-        assert len(edge_index_list) == len(edge_weight_list) == 6
+        assert len(laps) == 6
         self.pooling = pooling
         self.kernel_size = kernel_size
-        self.enc_l5 = SphericalChebBN2(16, 32, 64, self.kernel_size,
-                                       edge_index=edge_index_list[5],
-                                       edge_weight=edge_weight_list[5],
-                                       laplacian_type=laplacian_type)
-        self.enc_l4 = SphericalChebBNPool(64, 128, self.pooling, self.kernel_size,
-                                          edge_index=edge_index_list[4],
-                                          edge_weight=edge_weight_list[4],
-                                          laplacian_type=laplacian_type)
-        self.enc_l3 = SphericalChebBNPool(128, 256, self.pooling, self.kernel_size,
-                                          edge_index=edge_index_list[3],
-                                          edge_weight=edge_weight_list[3],
-                                          laplacian_type=laplacian_type)
-        self.enc_l2 = SphericalChebBNPool(256, 512, self.pooling, self.kernel_size,
-                                          edge_index=edge_index_list[2],
-                                          edge_weight=edge_weight_list[2],
-                                          laplacian_type=laplacian_type)
-        self.enc_l1 = SphericalChebBNPool(512, 512, self.pooling, self.kernel_size,
-                                          edge_index=edge_index_list[1],
-                                          edge_weight=edge_weight_list[1],
-                                          laplacian_type=laplacian_type)
-        self.enc_l0 = SphericalChebPool(512, 512, self.pooling, self.kernel_size,
-                                        edge_index=edge_index_list[0],
-                                        edge_weight=edge_weight_list[0],
-                                        laplacian_type=laplacian_type)
+        self.enc_l5 = SphericalChebBN2(16, 32, 64, self.kernel_size, lap=laps[5])
+        self.enc_l4 = SphericalChebBNPool(64, 128, self.pooling, self.kernel_size, lap=laps[4])
+        self.enc_l3 = SphericalChebBNPool(128, 256, self.pooling, self.kernel_size, lap=laps[3])
+        self.enc_l2 = SphericalChebBNPool(256, 512, self.pooling, self.kernel_size, lap=laps[2])
+        self.enc_l1 = SphericalChebBNPool(512, 512, self.pooling, self.kernel_size, lap=laps[1])
+        self.enc_l0 = SphericalChebPool(512, 512, self.pooling, self.kernel_size, lap=laps[0])
 
     def forward(self, x):
         """Forward Pass.
@@ -122,8 +141,13 @@ class Encoder(nn.Module):
         Returns:
             x_enc* :obj: `torch.Tensor`: output [batch x vertices x channels/features]
         """
-        x_enc5 = self.enc_l5(x)
-        x_enc4 = self.enc_l4(x_enc5)
+        if self.training and torch.is_grad_enabled():
+            # the two finest levels hold most of the activations, recompute them during backward instead
+            x_enc5 = checkpoint_bn(self.enc_l5, x)
+            x_enc4 = checkpoint_bn(self.enc_l4, x_enc5)
+        else:
+            x_enc5 = self.enc_l5(x)
+            x_enc4 = self.enc_l4(x_enc5)
         x_enc3 = self.enc_l3(x_enc4)
         x_enc2 = self.enc_l2(x_enc3)
         x_enc1 = self.enc_l1(x_enc2)
@@ -136,7 +160,7 @@ class EncoderTemporalConv(Encoder):
     """Encoder for the Spherical UNet temporality with convolution.
     """
 
-    def __init__(self, pooling, sequence_length, kernel_size, **kwargs):
+    def __init__(self, pooling, laps, sequence_length, kernel_size):
         """Initialization.
 
         Args:
@@ -145,14 +169,12 @@ class EncoderTemporalConv(Encoder):
             sequence_length (int): The number of images used per sample.
             kernel_size (int): Polynomial degree.
         """
-        super().__init__(pooling, kernel_size, **kwargs)
+        super().__init__(pooling, laps, kernel_size)
         self.sequence_length = sequence_length
         self.enc_l5 = SphericalChebBN2(
             self.enc_l5.in_channels * self.sequence_length,
             self.enc_l5.in_channels * self.sequence_length,
             self.enc_l5.out_channels,
             kernel_size,
-            edge_index=kwargs['edge_index_list'][-1],
-            edge_weight=kwargs['edge_weight_list'][-1],
-            laplacian_type=kwargs['laplacian_type']
+            lap=laps[-1],
         )
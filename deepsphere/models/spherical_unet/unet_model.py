@@ -11,6 +11,7 @@ from deepsphere.layers.samplings.healpix_pool_unpool import Healpix
 from deepsphere.layers.samplings.icosahedron_pool_unpool import Icosahedron
 from deepsphere.models.spherical_unet.decoder import Decoder
 from deepsphere.models.spherical_unet.encoder import Encoder, EncoderTemporalConv
+from deepsphere.models.spherical_unet.utils import SphericalLaplacian
 # from deepsphere.utils.laplacian_funcs import get_equiangular_laplacians, get_healpix_laplacians, get_icosahedron_laplacians
 from deepsphere.utils.index_weight_funcs import get_icosahedron_weights
 
@@ -45,10 +46,11 @@ class SphericalUNet(nn.Module):
         else:
             raise ValueError("Error: sampling method unknown. Please use icosahedron, healpix or equiangular.")
 
-        self.encoder = Encoder(self.pooling_class.pooling, self.kernel_size,
-                               edge_index_list, edge_weight_list, laplacian_type)
-        self.decoder = Decoder(self.pooling_class.unpooling, self.kernel_size,
-                               edge_index_list[1:], edge_weight_list[1:], laplacian_type)
+        # one laplacian per level, shared by the encoder and the decoder
+        self.laps = nn.ModuleList([SphericalLaplacian(edge_index, edge_weight, laplacian_type, kernel_size)
+                                   for edge_index, edge_weight in zip(edge_index_list, edge_weight_list)])
+        self.encoder = Encoder(self.pooling_class.pooling, self.laps, self.kernel_size)
+        self.decoder = Decoder(self.pooling_class.unpooling, self.laps[1:], self.kernel_size)
 
     def forward(self, x):
         """Forward Pass.
@@ -81,7 +83,7 @@ class SphericalUNetTemporalLSTM(SphericalUNet):
         """
         super().__init__(pooling_class, N, depth, laplacian_type, kernel_size, ratio)
         self.sequence_length = sequence_length
-        n_pixels = self.laps[0].size(0)
+        n_pixels = self.laps[0].num_nodes
         n_features = self.encoder.enc_l0.spherical_cheb.chebconv.in_channels
         self.lstm_l0 = nn.LSTM(input_size=n_pixels * n_features, hidden_size=n_pixels * n_features, batch_first=True)
 
@@ -127,7 +129,7 @@ class SphericalUNetTemporalConv(SphericalUNet):
         self.sequence_length = sequence_length
         self.encoder = EncoderTemporalConv(self.pooling_class.pooling, self.laps, self.sequence_length,
                                            self.kernel_size)
-        self.decoder = Decoder(self.pooling_class.unpooling, self.laps, self.kernel_size)
+        self.decoder = Decoder(self.pooling_class.unpooling, self.laps[1:], self.kernel_size)
 
     def forward(self, x):
         """Forward Pass.
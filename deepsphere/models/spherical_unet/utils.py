@@ -2,41 +2,165 @@
 """
 # pylint: disable=W0221
 import torch
+import torch.nn.functional as F
 from torch import nn
 from torch_geometric.nn import ChebConv
+from torch_geometric.nn.inits import glorot, zeros
 
+from deepsphere.utils.index_weight_funcs import get_chebyshev_basis, get_scaled_laplacian
 
-class SphericalChebConv(nn.Module):
-    def __init__(self, in_channels, out_channels, kernel_size, edge_index, edge_weight,
-                 laplacian_type):
+
+class SphericalLaplacian(nn.Module):
+    """Chebyshev basis of the rescaled laplacian of one level of the sphere,
+    shared by all the convolutions working at that level.
+    """
+
+    def __init__(self, edge_index, edge_weight, laplacian_type, kernel_size):
+        """Initialization.
+
+        Args:
+            edge_index (:obj:`torch.Tensor`): graph connectivity [2 x edges].
+            edge_weight (:obj:`torch.Tensor`): edge weights [edges], or None for unweighted edges.
+            laplacian_type (str): "normalized" or "combinatorial".
+            kernel_size (int): polynomial degree.
+        """
         super().__init__()
         assert laplacian_type in ['normalized', 'combinatorial'], 'Invalid normalization'
+        normalization = 'sym' if laplacian_type == 'normalized' else None
+
+        lap = get_scaled_laplacian(edge_index, edge_weight, normalization, lambda_max=2.)
+        self.num_nodes = lap.size(0)
+        self.kernel_size = kernel_size
+        # CSR lets the spmm walk each row contiguously instead of scattering with atomics
+        basis = get_chebyshev_basis(lap, kernel_size).to_sparse_csr()
+        crow_indices, col_indices = basis.crow_indices(), basis.col_indices()
+        if basis.col_indices().numel() < 2 ** 31:
+            # int32 indices halve the index traffic of the spmm
+            crow_indices, col_indices = crow_indices.int(), col_indices.int()
+        # kept as dense components so that they can be replicated or broadcast like any other buffer
+        self.basis_size = tuple(basis.size())
+        self.register_buffer("crow_indices", crow_indices, persistent=False)
+        self.register_buffer("col_indices", col_indices, persistent=False)
+        self.register_buffer("values", basis.values(), persistent=False)
 
-        self.register_buffer("edge_index", edge_index)
-        if edge_weight is None:
-            setattr(self, 'edge_weight', None)
-        else:
-            self.register_buffer("edge_weight", edge_weight)
+    def forward(self, x):
+        """Evaluate every order of the Chebyshev basis with a single sparse matmul.
 
-        self.register_buffer('lambda_max', torch.tensor(2., dtype=torch.float32))
-        self.chebconv = ChebConv(in_channels, out_channels, kernel_size,
-                                 normalization='sym' if laplacian_type == 'normalized' else None)
+        Args:
+            x (:obj:`torch.Tensor`): input [vertices x features]
 
-    def forward(self, x):
+        Returns:
+            :obj:`torch.Tensor`: T_0(L_hat) x, ..., T_{K-1}(L_hat) x [K x vertices x features]
+        """
+        # the values stay in float32, cast them on demand under mixed precision
+        values = self.values if self.values.dtype == x.dtype else self.values.to(x.dtype)
+        basis = torch.sparse_csr_tensor(self.crow_indices, self.col_indices, values, self.basis_size)
+        return torch.sparse.mm(basis, x).view(self.kernel_size, self.num_nodes, -1)
+
+
+class FastChebConv(ChebConv):
+    """ChebConv whose K per-order weight matrices are stored concatenated, so that all the orders
+    are applied with a single matmul on the stacked Chebyshev basis.
+    """
+
+    def __init__(self, in_channels, out_channels, K, **kwargs):
+        """Initialization.
+
+        Args:
+            in_channels (int): initial number of channels.
+            out_channels (int): output number of channels.
+            K (int): polynomial degree.
+        """
+        super().__init__(in_channels, out_channels, K, **kwargs)
+        self.weight = nn.Parameter(torch.cat([lin.weight.detach() for lin in self.lins], dim=1))
+        del self.lins
+        self.K = K
+
+    def reset_parameters(self):
+        """Reset the weights and the bias, each order initialized as the ChebConv one.
         """
-        batch, N, _ = x.shape
-
-        expand_index = self.edge_index.unsqueeze(1) + torch.arange(batch,
-                                                                   dtype=self.edge_index.dtype,
-                                                                   device=x.device).unsqueeze(1) * N
-        expand_index = expand_index.view(2, -1)
-        x = x.contiguous().view(batch * N, -1)
-        edge_weight = self.edge_weight
-        if edge_weight is not None:
-            edge_weight = edge_weight.repeat(batch)
+        if not hasattr(self, 'weight'):
+            # called by ChebConv.__init__, before the weights are concatenated
+            super().reset_parameters()
+            return
+        with torch.no_grad():
+            for weight in self.weight.split(self.in_channels, dim=1):
+                glorot(weight)
+        zeros(self.bias)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """Load checkpoints saved with the per-order ChebConv weights by concatenating them.
         """
-        x = self.chebconv(x, self.edge_index, self.edge_weight, lambda_max=self.lambda_max)
-        return x
+        keys = [key for key in state_dict if key.startswith(prefix + 'lins.') and key.endswith('.weight')]
+        if keys and prefix + 'weight' not in state_dict:
+            keys = sorted(keys, key=lambda key: int(key[len(prefix + 'lins.'):].split('.')[0]))
+            state_dict[prefix + 'weight'] = torch.cat([state_dict.pop(key) for key in keys], dim=1)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self, Tx):
+        """Forward Pass.
+
+        Args:
+            Tx (:obj:`torch.Tensor`): Chebyshev basis of the input [vertices x K * in_channels]
+
+        Returns:
+            :obj:`torch.Tensor`: output [vertices x out_channels]
+        """
+        return F.linear(Tx, self.weight, self.bias)
+
+    def __repr__(self):
+        # the normalization is applied by SphericalLaplacian, not by this layer
+        return '{}({}, {}, K={})'.format(self.__class__.__name__, self.in_channels, self.out_channels, self.K)
+
+
+class SphericalChebConv(nn.Module):
+    """Chebyshev Convolution on a fixed spherical graph, batched over a shared laplacian.
+    """
+
+    def __init__(self, in_channels, out_channels, kernel_size, lap):
+        """Initialization.
+
+        Args:
+            in_channels (int): initial number of channels.
+            out_channels (int): output number of channels.
+            kernel_size (int): polynomial degree.
+            lap (:obj:`SphericalLaplacian`): laplacian of the level.
+        """
+        super().__init__()
+        assert lap.kernel_size == kernel_size, 'Laplacian basis and kernel size mismatch'
+        self.kernel_size = kernel_size
+        self.lap = lap
+        self.chebconv = FastChebConv(in_channels, out_channels, kernel_size)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """Load checkpoints that still hold the graph buffers, which are now rebuilt from the sampling
+        by SphericalLaplacian and kept out of the state dict.
+        """
+        for key in ['edge_index', 'edge_weight', 'lambda_max']:
+            state_dict.pop(prefix + key, None)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self, x):
+        """Forward Pass.
+
+        Args:
+            x (:obj:`torch.Tensor`): input [batch x vertices x channels/features]
+
+        Returns:
+            :obj:`torch.Tensor`: output [batch x vertices x channels/features], a transposed view of
+                a vertex-major [vertices x batch x channels/features] tensor
+        """
+        batch, N, in_channels = x.shape
+        # fold the batch into the columns so that a single spmm covers the whole batch and every order,
+        # free when x is already vertex-major (e.g. the output of a previous convolution)
+        x = x.transpose(0, 1).reshape(N, batch * in_channels)
+        Tx = self.lap(x)
+
+        # [K x vertices x batch x channels] -> [vertices * batch x K * channels]
+        Tx = Tx.view(self.kernel_size, N, batch, in_channels)
+        Tx = Tx.permute(1, 2, 0, 3).reshape(N * batch, self.kernel_size * in_channels)
+        x = self.chebconv(Tx)
+        return x.view(N, batch, -1).transpose(0, 1)
 
 
 class SphericalChebBN(nn.Module):
@@ -66,8 +190,11 @@ class SphericalChebBN(nn.Module):
             :obj:`torch.tensor`: output [batch x vertices x channels/features]
         """
         x = self.spherical_cheb(x)
-        x = self.batchnorm(x.view(-1, x.shape[-1])).relu().view(*x.shape)
-        return x
+        batch, N, channels = x.shape
+        # the statistics are over batch and vertices alike, so normalize in the vertex-major layout of the
+        # convolution output without copying it, then relu in place on the batchnorm output
+        x = self.batchnorm(x.transpose(0, 1).reshape(-1, channels)).relu_()
+        return x.view(N, batch, channels).transpose(0, 1)
 
 
 class SphericalChebBNPool(nn.Module):
@@ -80,7 +207,7 @@ class SphericalChebBNPool(nn.Module):
         Args:
             in_channels (int): initial number of channels.
             out_channels (int): output number of channels.
-            lap (:obj:`torch.sparse.FloatTensor`): laplacian.
+            lap (:obj:`SphericalLaplacian`): laplacian.
             pooling (:obj:`torch.nn.Module`): pooling/unpooling module.
             kernel_size (int, optional): polynomial degree. Defaults to 3.
         """
@@ -5,11 +5,14 @@ The :mod:`tests` module contains different directory and files that have the goa
 Class
 -----
 
-You can see in this module the :class:`TestFoo` that contain the different method:
+You can see in this module the :class:`TestFoo` and :class:`TestSphericalChebConv` that contain the different method:
 
 .. autosummary::
 
     TestFoo.test_foo
+    TestSphericalChebConv.test_normalized
+    TestSphericalChebConv.test_combinatorial
+    TestSphericalChebConv.test_load_legacy_state_dict
 
 More Doc / Example
 ------------------
@@ -18,3 +21,4 @@ You can add then more doc and even examples
 """
 
 from .test_foo import TestFoo
+from .test_spherical_cheb_conv import TestSphericalChebConv
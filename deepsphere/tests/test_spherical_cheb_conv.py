@@ -0,0 +1,70 @@
+"""Tests of the batched Chebyshev convolution against the torch_geometric ChebConv
+"""
+
+import unittest
+
+import torch
+from torch_geometric.nn import ChebConv
+
+from deepsphere.models.spherical_unet.utils import SphericalChebConv, SphericalLaplacian
+from deepsphere.utils.index_weight_funcs import get_icosahedron_weights
+
+
+class TestSphericalChebConv(unittest.TestCase):
+    """Compare SphericalChebConv with ChebConv on the coarsest icosahedron level
+    """
+
+    in_channels = 3
+    out_channels = 4
+    kernel_size = 3
+
+    def setUp(self):
+        """Build the graph of the 42 vertices icosahedron
+        """
+        torch.manual_seed(0)
+        edge_list, _ = get_icosahedron_weights(42, 1)
+        self.edge_index = edge_list[0]
+
+    def _check_chebconv(self, laplacian_type, normalization):
+        """Check that SphericalChebConv gives the ChebConv output for every sample of a batch
+        """
+        lap = SphericalLaplacian(self.edge_index, None, laplacian_type, self.kernel_size)
+        conv = SphericalChebConv(self.in_channels, self.out_channels, self.kernel_size, lap)
+        ref = ChebConv(self.in_channels, self.out_channels, self.kernel_size, normalization=normalization)
+        with torch.no_grad():
+            for k, lin in enumerate(ref.lins):
+                lin.weight.copy_(conv.chebconv.weight[:, k * self.in_channels:(k + 1) * self.in_channels])
+            ref.bias.copy_(torch.randn_like(ref.bias))
+            conv.chebconv.bias.copy_(ref.bias)
+
+            x = torch.randn(2, lap.num_nodes, self.in_channels)
+            out = conv(x)
+            for sample, sample_out in zip(x, out):
+                expected = ref(sample, self.edge_index, lambda_max=2.)
+                self.assertTrue(torch.allclose(sample_out, expected, atol=1e-5))
+
+    def test_normalized(self):
+        """Normalized laplacian, ChebConv with the symmetric normalization
+        """
+        self._check_chebconv("normalized", "sym")
+
+    def test_combinatorial(self):
+        """Combinatorial laplacian, ChebConv without normalization
+        """
+        self._check_chebconv("combinatorial", None)
+
+    def test_load_legacy_state_dict(self):
+        """Checkpoints with the graph buffers and the per-order ChebConv weights still load strictly
+        """
+        lap = SphericalLaplacian(self.edge_index, None, "combinatorial", self.kernel_size)
+        conv = SphericalChebConv(self.in_channels, self.out_channels, self.kernel_size, lap)
+        weights = [torch.randn(self.out_channels, self.in_channels) for _ in range(self.kernel_size)]
+        state_dict = {"chebconv.lins.{}.weight".format(k): weight for k, weight in enumerate(weights)}
+        state_dict["chebconv.bias"] = torch.randn(self.out_channels)
+        state_dict["edge_index"] = self.edge_index
+        state_dict["lambda_max"] = torch.tensor(2.)
+
+        bias = state_dict["chebconv.bias"]
+        conv.load_state_dict(state_dict, strict=True)
+        self.assertTrue(torch.equal(conv.chebconv.weight, torch.cat(weights, dim=1)))
+        self.assertTrue(torch.equal(conv.chebconv.bias, bias))
@@ -5,7 +5,8 @@ import numpy as np
 import torch
 
 from torch_geometric.nn import knn_graph
-from torch_geometric.utils import to_undirected, remove_self_loops
+from torch_geometric.utils import add_self_loops, get_laplacian, to_undirected, remove_self_loops
+from torch_geometric.utils.num_nodes import maybe_num_nodes
 
 from .get_ico_coords import get_ico_coords
 from deepsphere.utils.samplings import (
@@ -13,7 +14,7 @@ from deepsphere.utils.samplings import (
     icosahedron_order_calculator,
 )
 
-__all__ = ['get_icosahedron_weights']
+__all__ = ['get_icosahedron_weights', 'get_scaled_laplacian', 'get_chebyshev_basis']
 
 
 def get_icosahedron_weights(nodes, depth):
@@ -44,3 +45,64 @@ def get_icosahedron_weights(nodes, depth):
         weight_list.append(None)
         order -= 1
     return edge_list[::-1], weight_list
+
+
+def get_scaled_laplacian(edge_index, edge_weight=None, normalization=None, lambda_max=2., num_nodes=None):
+    """Get the rescaled laplacian used by the Chebyshev recurrence as a sparse matrix.
+    Follows the normalization of :class:`torch_geometric.nn.ChebConv`, i.e. L_hat = 2L / lambda_max - I.
+
+    Args:
+        edge_index (:obj:`torch.Tensor`): graph connectivity [2 x edges].
+        edge_weight (:obj:`torch.Tensor`, optional): edge weights [edges]. Defaults to None.
+        normalization (str, optional): None for the combinatorial laplacian, 'sym' for the normalized one.
+        lambda_max (float, optional): largest eigenvalue of the laplacian. Defaults to 2.
+        num_nodes (int, optional): number of vertices. Inferred from edge_index if None.
+
+    Returns:
+        :obj:`torch.sparse.FloatTensor`: scaled laplacian [vertices x vertices].
+    """
+    num_nodes = maybe_num_nodes(edge_index, num_nodes)
+    edge_index, edge_weight = remove_self_loops(edge_index, edge_weight)
+    edge_index, edge_weight = get_laplacian(edge_index, edge_weight, normalization, dtype=torch.float32, num_nodes=num_nodes)
+    edge_weight = 2. * edge_weight / lambda_max
+    edge_weight.masked_fill_(edge_weight == float('inf'), 0)
+    edge_index, edge_weight = add_self_loops(edge_index, edge_weight, fill_value=-1., num_nodes=num_nodes)
+    # messages flow from edge_index[0] to edge_index[1], so the targets are the rows
+    lap = torch.sparse_coo_tensor(edge_index.flip(0), edge_weight, (num_nodes, num_nodes))
+    return lap.coalesce()
+
+
+def get_chebyshev_basis(lap, kernel_size):
+    """Stack the Chebyshev polynomials T_0(L_hat), ..., T_{K-1}(L_hat) of a scaled laplacian,
+    so that all the orders of a Chebyshev convolution are evaluated by a single sparse matmul.
+
+    Args:
+        lap (:obj:`torch.sparse.FloatTensor`): scaled laplacian [vertices x vertices].
+        kernel_size (int): number of polynomials K.
+
+    Returns:
+        :obj:`torch.sparse.FloatTensor`: stacked polynomials [K * vertices x vertices].
+    """
+    lap = _drop_zeros(lap)
+    N = lap.size(0)
+    identity = torch.sparse_coo_tensor(torch.arange(N).repeat(2, 1), torch.ones(N, dtype=lap.dtype), (N, N))
+    polys = [identity, lap][:kernel_size]
+    for _ in range(2, kernel_size):
+        polys.append(_drop_zeros(2. * torch.sparse.mm(lap, polys[-1]) - polys[-2]))
+    return torch.cat(polys).coalesce()
+
+
+def _drop_zeros(sparse_tensor):
+    """Remove the explicitly stored zeros of a sparse tensor, e.g. the diagonal of the
+    normalized scaled laplacian where the added self loops cancel out.
+
+    Args:
+        sparse_tensor (:obj:`torch.sparse.FloatTensor`): sparse COO tensor.
+
+    Returns:
+        :obj:`torch.sparse.FloatTensor`: coalesced sparse tensor without stored zeros.
+    """
+    sparse_tensor = sparse_tensor.coalesce()
+    mask = sparse_tensor.values() != 0
+    return torch.sparse_coo_tensor(sparse_tensor.indices()[:, mask], sparse_tensor.values()[mask],
+                                   sparse_tensor.size()).coalesce()
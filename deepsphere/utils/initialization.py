@@ -4,11 +4,13 @@
 
 import torch
 from torch import nn
+from torch.nn.parallel import DistributedDataParallel
 from torchvision import transforms
 
 from deepsphere.data.datasets.dataset import ARTCTemporaldataset
 from deepsphere.data.transforms.transforms import Stack
 from deepsphere.models.spherical_unet.unet_model import SphericalUNetTemporalConv, SphericalUNetTemporalLSTM
+from deepsphere.models.spherical_unet.utils import SphericalLaplacian
 
 
 def init_device(device, unet):
@@ -46,6 +48,31 @@ def init_device(device, unet):
     return unet, device
 
 
+def init_distributed_device(local_rank, unet):
+    """Initialize the device of the current process for distributed training, one process per gpu.
+    The default process group must already be initialized.
+
+    Args:
+        local_rank (int): index of the gpu of the current process on its node
+        unet (torch.Module): the model to place on the device
+
+    Returns:
+        torch.Module, torch.device: the model wrapped in DistributedDataParallel, the device
+    """
+    device = torch.device("cuda:{}".format(local_rank))
+    torch.cuda.set_device(device)
+    unet = unet.to(device)
+    # the Chebyshev bases are rebuilt identically by every process, do not broadcast them before each forward
+    basis_buffers = ["{}.{}".format(module_name, buffer_name)
+                     for module_name, module in unet.named_modules() if isinstance(module, SphericalLaplacian)
+                     for buffer_name, _ in module.named_buffers(recurse=False)]
+    # DDP has no public API to exclude buffers from its broadcast, only this private helper
+    DistributedDataParallel._set_params_and_buffers_to_ignore_for_model(unet, basis_buffers)  # pylint: disable=W0212
+    # the encoder/decoder topology is fixed, so DDP can reuse its gradient buckets across iterations
+    unet = DistributedDataParallel(unet, device_ids=[local_rank], gradient_as_bucket_view=True, static_graph=True)
+    return unet, device
+
+
 def init_unet_temp(parser):
     """Initialize UNet
 
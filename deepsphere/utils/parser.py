@@ -35,6 +35,8 @@ def create_parser():
     parser.add_argument("--learning_rate", default=None, type=float)
     parser.add_argument("--n_epochs", default=None, type=int)
     parser.add_argument("--kernel_size", default=None, type=int)
+    parser.add_argument("--accumulation_steps", default=None, type=int)
+    parser.add_argument("--compile", default=None, type=bool)
 
     parser.add_argument("--path_to_data", default=None)
     parser.add_argument("--model_save_path", default=None)
@@ -91,6 +93,6 @@ def parse_config(parser):
                 if arg_dict[key] is None:
                     arg_dict[key] = value
     for key, value in arg_dict.items():
-        if key != "device" and key != "type" and key != "sequence_length" and key != "prediction_shift" and arg_dict[key] is None:
+        if key not in ("device", "type", "sequence_length", "prediction_shift", "accumulation_steps", "compile") and arg_dict[key] is None:
             raise ValueError("The value of {} is set to None. Please define it in the config yaml file or in the command line.".format(key))
     return args
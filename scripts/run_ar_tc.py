@@ -1,10 +1,16 @@
 """Example script for running DeepSphere U-Net on reduced AR_TC dataset.
 """
 
+import contextlib
+import os
+
 import numpy as np
 import torch
+import torch.distributed as dist
+import torch.nn.functional as F
 from torch import nn, optim
 from torch.optim.lr_scheduler import ReduceLROnPlateau, StepLR
+from torch.utils.data.distributed import DistributedSampler
 from torch.utils.tensorboard import SummaryWriter
 
 from ignite.contrib.handlers.param_scheduler import create_lr_scheduler_with_warmup
@@ -12,42 +18,63 @@ from ignite.contrib.handlers.tensorboard_logger import GradsHistHandler, Optimiz
     TensorboardLogger, WeightsHistHandler
 from ignite.engine import Engine, Events, create_supervised_evaluator
 from ignite.handlers import EarlyStopping, TerminateOnNan
-from ignite.metrics import EpochMetric, RunningAverage
+from ignite.metrics import Metric, RunningAverage
 from ignite.contrib.handlers import ProgressBar
 from ignite.utils import convert_tensor
 
 from sklearn.model_selection import train_test_split
+from torchmetrics.classification import MultilabelAveragePrecision
 from torch_geometric.data import DenseDataLoader
 
-from deepsphere.data.datasets.dataset import ARTCDataset, ARTCH5Dataset
-from deepsphere.data.transforms.transforms import Normalize
+from deepsphere.data.datasets.dataset import ARTCDataset, ARTCH5Dataset, write_normalized_h5
 from deepsphere.models.spherical_unet.unet_model import SphericalUNet
-from deepsphere.utils.initialization import init_device
+from deepsphere.utils.initialization import init_device, init_distributed_device
 from deepsphere.utils.parser import create_parser, parse_config
 from deepsphere.utils.stats_extractor import stats_extractor
 
 
-def average_precision_compute_fn(y_pred, y_true):
-    """Attached function to the custom ignite metric AveragePrecisionMultiLabel
+class AveragePrecision(Metric):
+    """Ignite metric computing the per-class average precision with torchmetrics,
+    on the device holding the predictions instead of with sklearn on the host.
+    Each class is scored one-vs-rest on its own logit, as sklearn's average_precision_score on one-hot targets.
+    """
 
-    Args:
-        y_pred (:obj:`torch.Tensor`): model predictions
-        y_true (:obj:`torch.Tensor`): ground truths
+    def __init__(self, num_classes, output_transform=lambda x: x, device="cpu"):
+        """Initialization.
 
-    Raises:
-        RuntimeError: Indicates that sklearn should be installed by the user.
+        Args:
+            num_classes (int): number of classes
+            output_transform (callable): transform applied to the output of the engine
+            device (str or :obj:`torch.device`): device on which the metric states are kept
+        """
+        self.num_classes = num_classes
+        # the multiclass variant would softmax the logits across classes first, which changes the ranking of the
+        # samples within a class. Every process evaluates the whole validation set, so there is nothing to gather.
+        self._average_precision = MultilabelAveragePrecision(num_labels=num_classes, average=None,
+                                                             sync_on_compute=False).to(device)
+        super().__init__(output_transform=output_transform, device=device)
+
+    def reset(self):
+        """Reset the metric states at the beginning of an epoch.
+        """
+        self._average_precision.reset()
 
-    Returns:
-        :obj:`numpy.array`: average precision vector.
-                            Of the same length as the number of labels present in the data
-    """
-    try:
-        from sklearn.metrics import average_precision_score
-    except ImportError:
-        raise RuntimeError("This metric requires sklearn to be installed.")
+    def update(self, output):
+        """Accumulate the predictions and the ground truths of a batch.
 
-    ap = average_precision_score(y_true.numpy(), y_pred.numpy(), None)
-    return ap
+        Args:
+            output ((:obj:`torch.Tensor`, :obj:`torch.Tensor`)): predictions [samples x classes], class indices [samples]
+        """
+        y_pred, y = output
+        self._average_precision.update(y_pred, F.one_hot(y, self.num_classes))
+
+    def compute(self):
+        """Compute the average precisions.
+
+        Returns:
+            :obj:`numpy.array`: average precision vector, of the same length as the number of classes
+        """
+        return self._average_precision.compute().cpu().numpy()
 
 
 # Pylint and Ignite incompatibilities:
@@ -67,11 +94,9 @@ def validate_output_transform(x, y, y_pred):
         (:obj:`torch.Tensor`, :obj:`torch.Tensor`): model predictions and ground truths reformatted
     """
     output = y_pred
-    labels = y
     B, V, C = output.shape
-    B_labels, V_labels, C_labels = labels.shape
-    output = output.view(B * V, C)
-    labels = labels.view(B_labels * V_labels, C_labels)
+    output = output.reshape(B * V, C)
+    labels = y.view(-1).long()
     return output, labels
 
 
@@ -105,11 +130,13 @@ def add_tensorboard(engine_train, optimizer, model, log_dir):
     tb_logger.close()
 
 
-def get_dataloaders(parser_args):
+def get_dataloaders(parser_args, local_rank=-1):
     """Creates the datasets and the corresponding dataloaders
 
     Args:
         parser_args (dict): parsed arguments
+        local_rank (int): index of the current process on its node, the train set is sharded across the processes
+            of the default process group if it is not negative
 
     Returns:
         (:obj:`torch.utils.data.dataloader`, :obj:`torch.utils.data.dataloader`): train, validation dataloaders
@@ -120,33 +147,44 @@ def get_dataloaders(parser_args):
     seed = parser_args.seed
     means_path = parser_args.means_path
     stds_path = parser_args.stds_path
+    distributed = local_rank >= 0
+    # the download, the extraction, the statistics and the normalized copy all write to disk,
+    # the first process of each node prepares them while the other processes of the node wait
+    preparing = local_rank <= 0
 
+    if not preparing:
+        dist.barrier()
     data = ARTCDataset(path_to_data)
     train_indices, temp = train_test_split(data.idxs, train_size=partition[0], random_state=seed)
     val_indices, _ = train_test_split(temp, test_size=partition[2] / (partition[1] + partition[2]), random_state=seed)
-
-    if (means_path is None) or (stds_path is None):
-        train_set_stats = ARTCDataset(path_to_data, indices=train_indices)
-        means, stds = stats_extractor(train_set_stats)
-        np.save("./means.npy", means)
-        np.save("./stds.npy", stds)
-    else:
-        try:
-            means = np.load(means_path)
-            stds = np.load(stds_path)
-        except ValueError:
-            print("No means or stds were provided. Or path names incorrect.")
-
-    train_set = ARTCDataset(
-        path_to_data, indices=train_indices, transform=Normalize(means, stds)
-    )
-    validation_set = ARTCDataset(
-        path_to_data, indices=val_indices, transform=Normalize(means, stds)
-    )
-
-    dataloader_train = DenseDataLoader(train_set, batch_size=parser_args.batch_size, shuffle=True, num_workers=1)
+    # normalize once to disk, with labels already converted to class indices
+    h5_file = os.path.join(data.processed_dir, "data_5_all_normalized.h5")
+
+    if preparing:
+        if (means_path is None) or (stds_path is None):
+            train_set_stats = ARTCDataset(path_to_data, indices=train_indices)
+            means, stds = stats_extractor(train_set_stats)
+            np.save("./means.npy", means)
+            np.save("./stds.npy", stds)
+        else:
+            try:
+                means = np.load(means_path)
+                stds = np.load(stds_path)
+            except ValueError:
+                print("No means or stds were provided. Or path names incorrect.")
+        write_normalized_h5(data, means, stds, h5_file)
+        if distributed:
+            dist.barrier()
+    train_set = ARTCH5Dataset(h5_file, indices=train_indices)
+    validation_set = ARTCH5Dataset(h5_file, indices=val_indices)
+
+    loader_kwargs = dict(num_workers=max(4, (os.cpu_count() or 1) // 2), pin_memory=True, persistent_workers=True,
+                         prefetch_factor=4)
+    train_sampler = DistributedSampler(train_set, shuffle=True, drop_last=True) if distributed else None
+    dataloader_train = DenseDataLoader(train_set, batch_size=parser_args.batch_size, shuffle=train_sampler is None,
+                                       sampler=train_sampler, drop_last=True, **loader_kwargs)
     dataloader_validation = DenseDataLoader(validation_set, batch_size=parser_args.batch_size, shuffle=False,
-                                            num_workers=1)
+                                            **loader_kwargs)
     return dataloader_train, dataloader_validation
 
 
@@ -157,16 +195,40 @@ def main(parser_args):
     Args:
         parser_args (dict): parsed arguments
     """
-    dataloader_train, dataloader_validation = get_dataloaders(parser_args)
+    torch.backends.cudnn.benchmark = True
+    # set by torchrun / torch.distributed.launch, one process per GPU
+    local_rank = int(os.environ.get("LOCAL_RANK", -1))
+    distributed = local_rank >= 0
+    if distributed:
+        # bind the process to its GPU before any collective, NCCL uses the current device
+        torch.cuda.set_device(local_rank)
+        dist.init_process_group(backend="nccl")
+    # only the first process logs and saves
+    is_main_process = not distributed or dist.get_rank() == 0
+    dataloader_train, dataloader_validation = get_dataloaders(parser_args, local_rank)
     criterion = nn.CrossEntropyLoss()
 
     unet = SphericalUNet(parser_args.pooling_class, parser_args.n_pixels, parser_args.depth, parser_args.laplacian_type,
                          parser_args.kernel_size)
-    # unet = torch.jit.script(unet)
-    unet, device = init_device(parser_args.device, unet)
+    if distributed:
+        unet, device = init_distributed_device(local_rank, unet)
+    else:
+        unet, device = init_device(parser_args.device, unet)
+    if parser_args.compile and device.type == "cuda" and not isinstance(unet, nn.DataParallel):
+        # dynamo does not trace the sparse CSR basis and its torch.sparse.mm, every SphericalLaplacian forward is a
+        # graph break: only the dense segments between them (linear, batchnorm, activations, pooling) are compiled
+        # and captured by CUDA graphs. drop_last keeps the train batch shape static.
+        unet = torch.compile(unet, mode="reduce-overhead", fullgraph=False, dynamic=False)
     lr = parser_args.learning_rate
     optimizer = optim.Adam(unet.parameters(), lr=lr)
-    print(sum(p.numel() for p in unet.parameters() if p.requires_grad))
+    if is_main_process:
+        print(sum(p.numel() for p in unet.parameters() if p.requires_grad))
+
+    use_amp = device.type == "cuda"
+    amp_dtype = torch.bfloat16 if use_amp and torch.cuda.is_bf16_supported() else torch.float16
+    # bfloat16 keeps the float32 exponent range, only float16 needs loss scaling
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp and amp_dtype == torch.float16)
+    accumulation_steps = parser_args.accumulation_steps or 1
 
     def trainer(engine, batch):
         """Train Function to define train engine.
@@ -180,24 +242,36 @@ def main(parser_args):
             :obj:`torch.tensor` : train loss for that batch and epoch
         """
         unet.train()
-        optimizer.zero_grad()
+        # the optimizer only steps every accumulation_steps batches, the windows restart at every epoch so that
+        # the last (possibly shorter) one is applied before the validation and the learning rate schedulers
+        iteration = (engine.state.iteration - 1) % engine.state.epoch_length
+        window_start = iteration - iteration % accumulation_steps
+        window_size = min(accumulation_steps, engine.state.epoch_length - window_start)
+        accumulate = iteration - window_start + 1 < window_size
 
         data, labels = batch.x, batch.y
-        labels = labels.to(device)
-        data = data.to(device)
-        output = unet(data)
-
-        B, V, C = output.shape
-        B_labels, V_labels, C_labels = labels.shape
-        output = output.view(B * V, C)
-        labels = labels.view(B_labels * V_labels, C_labels).max(1)[1]
-
-        loss = criterion(output, labels)
-        loss.backward()
-        optimizer.step()
+        # labels travel as uint8 class indices, the loss needs them as int64
+        labels = labels.to(device, non_blocking=True).long()
+        data = data.to(device, non_blocking=True)
+        # no gradient allreduce on accumulation steps, DDP synchronizes the accumulated gradients on the last one.
+        # With static_graph DDP records the graph during the first iteration, which must not skip the allreduce.
+        with unet.no_sync() if distributed and accumulate and engine.state.iteration > 1 else contextlib.nullcontext():
+            with torch.autocast(device_type=device.type, dtype=amp_dtype, enabled=use_amp):
+                output = unet(data)
+
+                B, V, C = output.shape
+                output = output.reshape(B * V, C)
+                labels = labels.view(-1)
+
+                loss = criterion(output, labels)
+            scaler.scale(loss / window_size).backward()
+        if not accumulate:
+            scaler.step(optimizer)
+            scaler.update()
+            optimizer.zero_grad()
         return {'loss': loss.item()}
 
-    writer = SummaryWriter(parser_args.tensorboard_path)
+    writer = SummaryWriter(parser_args.tensorboard_path) if is_main_process else None
 
     engine_train = Engine(trainer)
 
@@ -212,13 +286,18 @@ def main(parser_args):
             convert_tensor(batch.y, device=device, non_blocking=non_blocking),
         )
 
+    # background, tropical cyclone and atmospheric river, as predicted by the decoder
     engine_validate = create_supervised_evaluator(
-        model=unet, metrics={"AP": EpochMetric(average_precision_compute_fn)}, device=device,
+        model=unet, metrics={"AP": AveragePrecision(num_classes=3, device=device)}, device=device,
+        non_blocking=True,
         output_transform=validate_output_transform,
         prepare_batch=prepare_batch
     )
 
-    engine_train.add_event_handler(Events.EPOCH_STARTED, lambda x: print("Starting Epoch: {}".format(x.state.epoch)))
+    if is_main_process:
+        engine_train.add_event_handler(Events.EPOCH_STARTED, lambda x: print("Starting Epoch: {}".format(x.state.epoch)))
+    if distributed:
+        engine_train.add_event_handler(Events.EPOCH_STARTED, lambda x: dataloader_train.sampler.set_epoch(x.state.epoch))
     engine_train.add_event_handler(Events.ITERATION_COMPLETED, TerminateOnNan())
 
     @engine_train.on(Events.EPOCH_COMPLETED)
@@ -228,7 +307,8 @@ def main(parser_args):
         Args:
             engine (ignite.engine): train engine
         """
-        print("beginning validation epoch")
+        if is_main_process:
+            print("beginning validation epoch")
         engine_validate.run(dataloader_validation)
 
     reduce_lr_plateau = ReduceLROnPlateau(
@@ -256,6 +336,8 @@ def main(parser_args):
         Args:
             engine (ignite.engine): validation engine
         """
+        if not is_main_process:
+            return
         ap = engine.state.metrics["AP"]
         mean_average_precision = np.mean(ap[1:])
         print("Average precisions:", ap)
@@ -284,15 +366,23 @@ def main(parser_args):
     )
     engine_validate.add_event_handler(Events.EPOCH_COMPLETED, earlystopper)
 
-    add_tensorboard(engine_train, optimizer, unet, log_dir=parser_args.tensorboard_path)
+    if is_main_process:
+        add_tensorboard(engine_train, optimizer, unet, log_dir=parser_args.tensorboard_path)
 
-    pbar = ProgressBar()
-    pbar.attach(engine_train, metric_names=['loss'])
+        pbar = ProgressBar()
+        pbar.attach(engine_train, metric_names=['loss'])
 
     engine_train.run(dataloader_train, max_epochs=parser_args.n_epochs)
 
-    pbar.close()
-    torch.save(unet.state_dict(), parser_args.model_save_path + "unet_state.pt")
+    if is_main_process:
+        pbar.close()
+        # strip the torch.compile and (Distributed)DataParallel wrappers so the keys match a plain SphericalUNet
+        model = getattr(unet, "_orig_mod", unet)
+        if isinstance(model, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
+            model = model.module
+        torch.save(model.state_dict(), parser_args.model_save_path + "unet_state.pt")
+    if distributed:
+        dist.destroy_process_group()
 
 
 if __name__ == "__main__":
@@ -65,7 +65,7 @@ def validate_output_transform(x, y, y_pred):
     labels = y
     B, V, C = output.shape
     B_labels, V_labels, C_labels = labels.shape
-    output = output.view(B * V, C)
+    output = output.reshape(B * V, C)
     labels = labels.view(B_labels * V_labels, C_labels)
     return output, labels
 
@@ -179,7 +179,7 @@ def main(parser_args):
 
         B, V, C = output.shape
         B_labels, V_labels, C_labels = labels.shape
-        output = output.view(B * V, C)
+        output = output.reshape(B * V, C)
         labels = labels.view(B_labels * V_labels, C_labels).max(1)[1]
 
         loss = criterion(output, labels)